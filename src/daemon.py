@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bs4 import BeautifulSoup
+
+from spider import CURR_FOLDER, Album, Comment, NetEase, Singer
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+class RequestBudget(object):
+    """Spread at most `per_hour` requests evenly over an hour."""
+
+    def __init__(self, per_hour):
+        self.per_hour = per_hour
+        self.spacing = HOUR / per_hour
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Reserve the next slot, returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.spacing
+            return slot - now
+
+
+class Daemon(NetEase):
+    """Keep the counters of a singer snapshot fresh.
+
+    Every album and song has its own refresh interval, short for popular or
+    recently released ones and long for the back catalogue. Due items are
+    refreshed in order as long as the request budget allows it; the snapshot
+    is saved periodically and only the docs of refreshed items are rewritten.
+    """
+
+    def __init__(self, singer_id, requests_per_hour=600, base_url='https://music.163.com',
+                 json_path=None, doc_root=None, base_interval=7 * DAY, min_interval=HOUR,
+                 max_interval=30 * DAY, save_interval=60, cache_root=None):
+        self.json_path = json_path or os.path.join(CURR_FOLDER, 'json_src', str(singer_id) + '.json')
+        with open(self.json_path) as f:
+            self.singer = Singer.from_json(json.load(f))
+        self.doc_root = doc_root or os.path.join(CURR_FOLDER, '..', 'docs',
+                                                 self._to_filename(self.singer.alias))
+
+        self.base_url = base_url
+        if cache_root is not None:
+            self.cache_root = cache_root
+        self.budget = RequestBudget(requests_per_hour)
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.save_interval = save_interval
+
+        self.albums = {al.id: al for al in self.singer.albums}
+        self.songs = {so.id: (al, so) for al in self.singer.albums for so in al.songs}
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved = time.time()
+        self._server = None
+        self.stats = {
+            'singer_id': self.singer.id,
+            'started': time.time(),
+            'requests': 0,
+            'errors': 0,
+            'last': None,
+            'saved': None
+        }
+        self.schedule()
+
+    def interval(self, popularity, release):
+        """Refresh interval in seconds for an item with `popularity` comments released at `release`."""
+        try:
+            age = (datetime.date.today() - datetime.date.fromisoformat(release[:10])).days
+        except (TypeError, ValueError):
+            age = 10 * 365
+        weight = (1 + math.log10(1 + max(popularity, 0))) * (1 + 365 / (365 + max(age, 0)))
+        return min(self.max_interval, max(self.min_interval, self.base_interval / weight))
+
+    def _album_interval(self, al):
+        return self.interval(al.num_comments, al.time)
+
+    def _song_interval(self, so):
+        return self.interval(so.comment.total, so.time)
+
+    def schedule(self):
+        """Put every album and song in the queue, due right away, most popular first."""
+        now = time.time()
+        self.queue = [(now, self._album_interval(al), 'album', al.id) for al in self.singer.albums]
+        self.queue += [(now, self._song_interval(so), 'song', so.id) for _, so in self.songs.values()]
+        heapq.heapify(self.queue)
+
+    def refresh_album(self, album_id):
+        al = self.albums[album_id]
+        url = '{:s}/album?id={:d}'.format(self.base_url, album_id)
+
+        fresh = Album(album_id, rebuild=True)
+        fresh.soup = BeautifulSoup(self.get_url(url, update=True), 'html.parser')
+        fresh._get_counts()
+
+        with self._lock:
+            al.num_comments = fresh.num_comments
+            al.num_shared = fresh.num_shared
+            al.num_songs = fresh.num_songs
+            al._songs_info = fresh._songs_info
+
+            scores = {s.id: s.score for s in fresh._songs_info}
+            changed = [so for so in al.songs if so.id in scores and so.score != scores[so.id]]
+            for so in changed:
+                so.score = scores[so.id]
+
+            al_songs = os.path.join(al._album_root(self.doc_root), 'songs')
+            if not os.path.exists(al_songs):
+                os.makedirs(al_songs)
+            al._build_readme(self.doc_root)
+            for so in changed:
+                so._build_song(al_songs)
+            self._dirty = True
+        return self._album_interval(al)
+
+    def refresh_song(self, song_id):
+        al, so = self.songs[song_id]
+        url = '{:s}/weapi/v1/resource/comments/R_SO_4_{:d}?csrf_token='.format(self.base_url, song_id)
+
+        comment = Comment(song_id, eager=False)
+        comment.cache_root = self.cache_root
+        comment.get_comments(update=True, url=url)
+
+        with self._lock:
+            so.comment.cons = comment.cons
+            so.comment.total = comment.total
+            so.comment.num_coms = comment.num_coms
+
+            so._build_song(os.path.join(al._album_root(self.doc_root), 'songs'))
+            self._dirty = True
+        return self._song_interval(so)
+
+    def step(self):
+        """Wait for the next due item and refresh it, returns its (kind, id) or None if stopped."""
+        if not self.queue:
+            # nothing to refresh, idle until stopped
+            self._stop.wait(self.min_interval)
+            return None
+        due, interval, kind, item_id = self.queue[0]
+        if self._stop.wait(max(0.0, due - time.time())):
+            return None
+        if self._stop.wait(self.budget.reserve()):
+            return None
+        with self._lock:
+            heapq.heappop(self.queue)
+
+        try:
+            if kind == 'album':
+                interval = self.refresh_album(item_id)
+            else:
+                interval = self.refresh_song(item_id)
+        except Exception as e:
+            print('WARNING: failed to refresh {:s} {:d}: {!r}'.format(kind, item_id, e))
+            with self._lock:
+                self.stats['errors'] += 1
+
+        now = time.time()
+        with self._lock:
+            heapq.heappush(self.queue, (now + interval, interval, kind, item_id))
+            self.stats['requests'] += 1
+            self.stats['last'] = {'kind': kind, 'id': item_id, 'time': now}
+
+        if now - self._saved >= self.save_interval:
+            self.save()
+        return kind, item_id
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            json_con = self.singer.to_json()
+            self._dirty = False
+
+        tmp_path = '{:s}.{:d}.tmp'.format(self.json_path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump(json_con, fp, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.json_path)
+
+        self._saved = time.time()
+        with self._lock:
+            self.stats['saved'] = self._saved
+
+    def run(self):
+        try:
+            while not self._stop.is_set():
+                self.step()
+        finally:
+            self.save()
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def status(self):
+        with self._lock:
+            ret = dict(self.stats)
+            ret['queued'] = len(self.queue)
+            ret['next'] = [{'kind': kind, 'id': item_id, 'due': due}
+                           for due, _, kind, item_id in heapq.nsmallest(5, self.queue)]
+        ret['requests_per_hour'] = self.budget.per_hour
+        return ret
+
+    def serve_status(self, host='127.0.0.1', port=8000):
+        """Serve `status()` as json on GET /status from a background thread."""
+        daemon = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/status':
+                    self.send_error(404)
+                    return
+                body = json.dumps(daemon.status()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), StatusHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep a singer snapshot fresh.')
+    parser.add_argument('singer_id', type=int, nargs='?', default=2116)
+    parser.add_argument('--budget', type=int, default=600, help='requests per hour')
+    parser.add_argument('--port', type=int, default=8000, help='port of the status endpoint')
+    args = parser.parse_args()
+
+    d = Daemon(args.singer_id, requests_per_hour=args.budget)
+    print('Status at http://{:s}:{:d}/status'.format(*d.serve_status(port=args.port)))
+    try:
+        d.run()
+    except KeyboardInterrupt:
+        d.stop()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from spider import CURR_FOLDER
+
+TABLES = ('songs', 'albums', 'comments')
+
+
+def _to_date(time):
+    # release dates look like '2019-11-14', a few albums only have a year or nothing
+    time = (time or '').strip()
+    if len(time) == 4 and time.isdigit():
+        time += '-01-01'
+    try:
+        return np.datetime64(time[:10], 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+
+def flatten(singers):
+    """Flatten singer snapshots (the json of `Singer.to_json`) into columns of numpy arrays."""
+    songs = {k: [] for k in ('singer_id', 'album_id', 'song_id', 'name', 'duration',
+                             'score', 'comment_total', 'release')}
+    albums = {k: [] for k in ('singer_id', 'album_id', 'name', 'num_songs', 'num_comments',
+                              'num_shared', 'release')}
+    comments = {k: [] for k in ('singer_id', 'song_id', 'comment_id', 'user_id', 'liked_count',
+                                'content')}
+
+    for si in singers:
+        for al in si['albums']:
+            albums['singer_id'].append(si['id'])
+            albums['album_id'].append(al['id'])
+            albums['name'].append(al['name'])
+            albums['num_songs'].append(al['num_song'])
+            albums['num_comments'].append(al['num_comments'])
+            albums['num_shared'].append(al['num_shared'])
+            albums['release'].append(_to_date(al['time']))
+
+            for so in al['songs']:
+                songs['singer_id'].append(si['id'])
+                songs['album_id'].append(al['id'])
+                songs['song_id'].append(so['id'])
+                songs['name'].append(so['name'])
+                songs['duration'].append(so['duration'])
+                songs['score'].append(so['score'])
+                songs['comment_total'].append(so['comm']['total'])
+                songs['release'].append(_to_date(so['time']))
+
+                for c in so['comm']['con']:
+                    comments['singer_id'].append(si['id'])
+                    comments['song_id'].append(so['id'])
+                    comments['comment_id'].append(c['commentId'])
+                    comments['user_id'].append(c['user']['userId'])
+                    comments['liked_count'].append(c['likedCount'])
+                    comments['content'].append(c['content'])
+
+    return {
+        'songs': _to_columns(songs),
+        'albums': _to_columns(albums),
+        'comments': _to_columns(comments)
+    }
+
+
+def _to_columns(table):
+    columns = {}
+    for key, val in table.items():
+        if key == 'release':
+            columns[key] = np.array(val, dtype='datetime64[D]')
+        elif key in ('name', 'content'):
+            # object arrays keep each string at its own length, unlike fixed width '<U'
+            columns[key] = np.array(val, dtype=object)
+        else:
+            columns[key] = np.array(val, dtype=np.int64)
+    return columns
+
+
+def save(tables, folder, fmt=None):
+    """Write every table to `folder`, as parquet if pyarrow is installed, else as npz."""
+    fmt = fmt or ('parquet' if pq is not None else 'npz')
+    if fmt == 'parquet' and pq is None:
+        raise ImportError('pyarrow is required for the parquet format')
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    paths = []
+    for name, columns in tables.items():
+        path = os.path.join(folder, '{:s}.{:s}'.format(name, fmt))
+        if fmt == 'parquet':
+            pq.write_table(pa.table(columns), path)
+        else:
+            # npz can not hold object arrays without pickle
+            np.savez_compressed(path, **{k: v.astype(str) if v.dtype == object else v
+                                         for k, v in columns.items()})
+        paths.append(path)
+    return paths
+
+
+def load(folder):
+    """Read the tables written by `save`, whichever format was used."""
+    tables = {}
+    for name in TABLES:
+        parquet_path = os.path.join(folder, name + '.parquet')
+        if os.path.exists(parquet_path):
+            if pq is None:
+                raise ImportError('pyarrow is required to read {:s}'.format(parquet_path))
+            table = pq.read_table(parquet_path)
+            tables[name] = {k: table.column(k).to_numpy() for k in table.column_names}
+        else:
+            with np.load(os.path.join(folder, name + '.npz')) as npz:
+                tables[name] = {k: npz[k] for k in npz.files}
+    return tables
+
+
+def _take(columns, idx):
+    return {k: v[idx] for k, v in columns.items()}
+
+
+def top_k(columns, key, k=10):
+    """Rows with the `k` largest values of column `key`, in descending order."""
+    values = columns[key]
+    k = min(k, len(values))
+    if k == 0:
+        return _take(columns, np.arange(0))
+    idx = np.argpartition(-values, k - 1)[:k]
+    idx = idx[np.argsort(-values[idx], kind='stable')]
+    return _take(columns, idx)
+
+
+def top_songs(tables, k=10):
+    return top_k(tables['songs'], 'score', k)
+
+
+def top_comments(tables, k=10):
+    return top_k(tables['comments'], 'liked_count', k)
+
+
+def years(release):
+    """Release year of each row, 0 for unknown dates."""
+    known = ~np.isnat(release)
+    ret = np.zeros(len(release), dtype=np.int64)
+    ret[known] = release[known].astype('datetime64[Y]').astype(np.int64) + 1970
+    return ret
+
+
+def score_by_year(tables):
+    """Per release year: number of songs and min / median / mean / max score."""
+    songs = tables['songs']
+    year = years(songs['release'])
+    order = np.lexsort((songs['score'], year))
+    year, score = year[order], songs['score'][order]
+
+    uniq, start, count = np.unique(year, return_index=True, return_counts=True)
+    if len(uniq) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return {'year': empty, 'count': empty, 'min': empty, 'median': np.zeros(0),
+                'mean': np.zeros(0), 'max': empty}
+    lower = score[start + (count - 1) // 2]
+    upper = score[start + count // 2]
+    return {
+        'year': uniq,
+        'count': count,
+        'min': score[start],
+        'median': (lower + upper) / 2,
+        'mean': np.add.reduceat(score, start) / count,
+        'max': score[start + count - 1]
+    }
+
+
+def duration_histogram(tables, bins=10):
+    """Histogram of song durations in seconds, returns (counts, bin_edges)."""
+    return np.histogram(tables['songs']['duration'] / 1000, bins=bins)
+
+
+def report(tables, k=10, bins=10):
+    songs = top_songs(tables, k)
+    print('## Top {:d} songs\n'.format(len(songs['song_id'])))
+    print('|歌名|分数|评论数|')
+    print('|:---:|:---:|:---:|')
+    for name, score, total in zip(songs['name'], songs['score'], songs['comment_total']):
+        print('|{:s}|{:d}|{:d}|'.format(name, score, total))
+
+    comments = top_comments(tables, k)
+    print('\n## Top {:d} comments\n'.format(len(comments['comment_id'])))
+    print('|点赞数|评论|')
+    print('|:---:|:---|')
+    for liked, content in zip(comments['liked_count'], comments['content']):
+        print('|{:d}|{:s}|'.format(liked, content.replace('\n', ' ')))
+
+    dist = score_by_year(tables)
+    print('\n## Score by year\n')
+    print('|年份|歌曲数|最低|中位数|平均|最高|')
+    print('|:---:|:---:|:---:|:---:|:---:|:---:|')
+    for row in zip(*(dist[k] for k in ('year', 'count', 'min', 'median', 'mean', 'max'))):
+        print('|{:d}|{:d}|{:d}|{:.1f}|{:.1f}|{:d}|'.format(*row))
+
+    counts, edges = duration_histogram(tables, bins)
+    print('\n## Duration\n')
+    print('|时长 (s)|歌曲数|')
+    print('|:---:|:---:|')
+    for lo, hi, cnt in zip(edges[:-1], edges[1:], counts):
+        print('|{:.1f}-{:.1f}|{:d}|'.format(lo, hi, cnt))
+
+
+def main(singer_ids, folder=None, fmt=None):
+    singers = []
+    for singer_id in singer_ids:
+        with open(os.path.join(CURR_FOLDER, 'json_src', str(singer_id) + '.json')) as f:
+            singers.append(json.load(f))
+
+    tables = flatten(singers)
+    save(tables, folder or os.path.join(CURR_FOLDER, 'columnar'), fmt)
+    return tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export singer snapshots to columnar files.')
+    parser.add_argument('singer_ids', type=int, nargs='*', default=[2116])
+    parser.add_argument('--folder', default=None, help='output folder')
+    parser.add_argument('--format', choices=['parquet', 'npz'], default=None)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--bins', type=int, default=10)
+    args = parser.parse_args()
+
+    report(main(args.singer_ids, args.folder, args.format), args.top, args.bins)
@@ -24,11 +24,12 @@ CURR_FOLDER = os.path.dirname(__file__)
 class NetEase(object):
     head = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.121 Safari/537.36'}
+    cache_root = os.path.join(CURR_FOLDER, 'cached')
 
-    def get_url(self, url, decode=True):
+    def get_url(self, url, decode=True, update=False):
         urlfile = self.url_to_file(url)
-        urlpath = os.path.join(CURR_FOLDER, 'cached', urlfile)
-        if os.path.exists(urlpath):
+        urlpath = os.path.join(self.cache_root, urlfile)
+        if os.path.exists(urlpath) and not update:
             with open(urlpath, 'rb') as f:
                 url_bytes = pickle.load(f)
                 if decode:
@@ -42,12 +43,14 @@ class NetEase(object):
             try:
                 ret = request.urlopen(self.req).read()
 
-                urlfolder = os.path.join(CURR_FOLDER, 'cached')
-                if not os.path.exists(urlfolder):
-                    os.makedirs(urlfolder)
+                if not os.path.exists(self.cache_root):
+                    os.makedirs(self.cache_root)
 
-                with open(urlpath, 'wb') as f:
+                # write to a temporary file first, other workers may read the same cache
+                tmppath = '{:s}.{:d}.tmp'.format(urlpath, os.getpid())
+                with open(tmppath, 'wb') as f:
                     pickle.dump(ret, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmppath, urlpath)
                 break
             except URLError:
                 print('WARNING: timeout at {:s}'.format(url))
@@ -189,7 +192,7 @@ class Album(NetEase):
             if eager:
                 self.get_info()
 
-    def get_info(self):
+    def get_info(self, songs=True):
         self._img_link = self.soup.find('meta', attrs={'property': 'og:image'})['content']
         self._img_type = self._img_link.split('.')[-1]
         self.img = self.get_url(self._img_link, decode=False)
@@ -214,6 +217,11 @@ class Album(NetEase):
                 'div', attrs={'id': 'album-desc-dot'}).find_all('p')]
         else:
             self.description = ''
+        self._get_counts()
+        if songs:
+            self._get_all_songs()
+
+    def _get_counts(self):
         self.num_comments = int(self.soup.find('span', id='cnt_comment_count').text.strip())
         self.num_shared = int(self.soup.find('a', attrs={'class': 'u-btni u-btni-share'})['data-count'])
         self.num_songs = int(self.soup.find('span', class_='sub s-fc3',
@@ -222,7 +230,6 @@ class Album(NetEase):
         jsong = json.loads(self.soup.find('textarea', id='song-list-pre-data').text)
         SongInfo = namedtuple('SongInfo', ['id', 'duration', 'score'])
         self._songs_info = [SongInfo(s['id'], s['duration'], s['score']) for s in jsong]
-        self._get_all_songs()
 
     def _get_all_songs(self):
         self.songs = []
@@ -273,9 +280,7 @@ class Album(NetEase):
         return al
 
     def _build_album(self, singer_root):
-        al_root = os.path.join(singer_root, 'albums',
-                               self._to_filename(self.name) + '_{:d}'.format(self.id))
-        al_readme = os.path.join(al_root, 'README.md')
+        al_root = self._album_root(singer_root)
 
         # for album image
         al_imgs_folder = os.path.join(al_root, 'imgs')
@@ -291,10 +296,23 @@ class Album(NetEase):
         if not os.path.exists(al_songs):
             os.makedirs(al_songs)
 
+        for so in self.songs:
+            so._build_song(al_songs)
+
+        self._build_readme(singer_root)
+
+    def _album_root(self, singer_root):
+        return os.path.join(singer_root, 'albums',
+                            self._to_filename(self.name) + '_{:d}'.format(self.id))
+
+    def _build_readme(self, singer_root):
+        al_readme = os.path.join(self._album_root(singer_root), 'README.md')
+        al_img_name = self._to_filename(self.name) + '.jpg'
+
         with open(al_readme, 'w') as f:
             f.write('<p align=\"center\">\n'
                     '\t<img src=\"{:s}\" alt=\"album_img\" />\n'
-                    '</p>\n\n'.format(os.path.join('imgs', os.path.basename(al_img_path))))
+                    '</p>\n\n'.format(os.path.join('imgs', al_img_name)))
             f.write(f'# [{self.name}]({self.url})\n\n')
             f.write(f'* 时间：{self.time}\n')
             f.write('* 歌手：{:s}\n'.format('，'.join(self.singers)))
@@ -303,7 +321,6 @@ class Album(NetEase):
             f.write('## Songs\n\n')
             for so in self.songs:
                 so_path = os.path.join('songs', self._to_filename(so.name) + f'_{so.id}')
-                so._build_song(al_songs)
                 f.write('* [{:s}]({:s})\n'.format(so.name, os.path.join(so_path, 'README.md')))
 
             f.write('## Appendix\n\n')
@@ -527,34 +544,44 @@ class Comment(NetEase):
         self.id = song_id
         self.url = 'http://music.163.com/weapi/v1/resource/comments/' \
                    'R_SO_4_{:d}?csrf_token='.format(song_id)
-        cached_file = self._to_filename(self.url)
-        cached_path = os.path.join(CURR_FOLDER, 'cached', cached_file + '_{:d}'.format(self.id) + '.json')
 
         self.cons = []
 
         if eager:
-            if os.path.exists(cached_path) and not update:
-                with open(cached_path) as f:
-                    r_dict = json.load(f)
-            else:
-                text = {
-                    'username': '',
-                    'password': '',
-                    'rememberLogin': 'true',
-                    'offset': 0
-                }
-                payload = self.get_params(text)
-                json_str = requests.post(self.url, data=payload, headers=self.head)
-                r_dict = json.loads(json_str.text)
-
-                with open(cached_path, 'w') as f:
-                    json.dump(r_dict, f, indent=4)
+            self.get_comments(update)
 
-            for com in r_dict['hotComments']:
-                self.cons.append(Comm(com))
+        self.num_coms = len(self.cons)
 
-            self.total = r_dict['total']
+    def get_comments(self, update=False, url=None):
+        url = url or self.url
+        cached_file = self._to_filename(url)
+        cached_path = os.path.join(self.cache_root, cached_file + '_{:d}'.format(self.id) + '.json')
 
+        if os.path.exists(cached_path) and not update:
+            with open(cached_path) as f:
+                r_dict = json.load(f)
+        else:
+            text = {
+                'username': '',
+                'password': '',
+                'rememberLogin': 'true',
+                'offset': 0
+            }
+            payload = self.get_params(text)
+            json_str = requests.post(url, data=payload, headers=self.head)
+            r_dict = json.loads(json_str.text)
+
+            cached_folder = os.path.dirname(cached_path)
+            if not os.path.exists(cached_folder):
+                os.makedirs(cached_folder)
+
+            tmp_path = '{:s}.{:d}.tmp'.format(cached_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(r_dict, f, indent=4)
+            os.replace(tmp_path, cached_path)
+
+        self.cons = [Comm(com) for com in r_dict['hotComments']]
+        self.total = r_dict['total']
         self.num_coms = len(self.cons)
 
     def to_json(self):
@@ -575,6 +602,8 @@ class Comment(NetEase):
         comment.num_coms = json_con['num_coms']
         comment.cons = [Comm.from_json(c) for c in json_con['con']]
 
+        return comment
+
     def create_secret_key(self, size):
         return (''.join(map(lambda xx: (hex(ord(xx))[2:]), str(os.urandom(size)))))[0:16]
 
@@ -583,8 +612,8 @@ class Comment(NetEase):
         if isinstance(text, bytes):
             text = text.decode('utf-8')
         text = text + str(pad * chr(pad))
-        encryptor = AES.new(sec_key, 2, '0102030405060708')
-        ciphertext = encryptor.encrypt(text)
+        encryptor = AES.new(sec_key.encode('utf-8'), 2, b'0102030405060708')
+        ciphertext = encryptor.encrypt(text.encode('utf-8'))
         ciphertext = base64.b64encode(ciphertext)
         return ciphertext
 
@@ -623,10 +652,10 @@ class Comm(object):
     def to_json(self):
         return {
             'commentId': self.id,
-            'user': self.user,
+            'user': self.user.to_json(),
             'content': self.content,
             'likedCount': self.liked_cnt,
-            'beReplied': self.replied.to_json() if isinstance(self.replied, Reply) else ''
+            'beReplied': [self.replied.to_json()] if isinstance(self.replied, Reply) else []
         }
 
     @classmethod
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import encodebytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.request import urlopen
+
+from daemon import Daemon
+
+ALBUM_PAGE = '''<html><body>
+<span id="cnt_comment_count">{comments}</span>
+<a class="u-btni u-btni-share" data-count="{shared}"></a>
+<span class="sub s-fc3">1首歌</span>
+<textarea id="song-list-pre-data">[{{"id": 20, "duration": 180000, "score": {score}}}]</textarea>
+</body></html>'''
+
+
+class StandIn(BaseHTTPRequestHandler):
+    counters = {'comments': 3, 'shared': 4, 'score': 90, 'total': 1000}
+
+    def do_GET(self):
+        self._reply('text/html', ALBUM_PAGE.format(**self.counters))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._reply('application/json', json.dumps({
+            'total': self.counters['total'],
+            'hotComments': [{'commentId': 1, 'user': {'userId': 2, 'nickname': 'u'},
+                             'content': 'fresh', 'likedCount': 7, 'beReplied': []}]
+        }))
+
+    def _reply(self, content_type, body):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _snapshot():
+    song = {
+        'id': 20, 'url': 'https://music.163.com/song?id=20', 'name': 'song', 'time': '2003-05-01',
+        'score': 50, 'album': 'album', 'singers': ['s'], 'duration': 180000,
+        'ric': {'id': 20, 'url': '', 'modified': False, 'singer': '', 'composer': '',
+                'songwriter': '', 'arrangement': '', 'lyric': ['la']},
+        'comm': {'id': 20, 'url': '', 'con': [], 'total': 1, 'num_coms': 0}
+    }
+    album = {
+        'id': 10, 'url': 'https://music.163.com/album?id=10', 'img': encodebytes(b'img').decode('ascii'),
+        'img_link': '', 'name': 'album', 'singers': ['s'], 'company': '', 'time': '2003-05-01',
+        'description': [], 'num_comments': 0, 'num_shared': 0, 'num_song': 1,
+        'songs_info': [{'id': 20, 'duration': 180000, 'score': 50}], 'songs': [song]
+    }
+    return {'id': 1, 'url': '', 'name': 's', 'alias': 's', 'albums': [album], 'album_ids': [10]}
+
+
+class TestDaemon(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:{:d}'.format(self.server.server_address[1])
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp.name, '1.json')
+        with open(self.json_path, 'w') as f:
+            json.dump(_snapshot(), f)
+        self.doc_root = os.path.join(self.tmp.name, 'docs')
+        self.cache_root = os.path.join(self.tmp.name, 'cached')
+        self.daemon = Daemon(1, requests_per_hour=3600 * 100, base_url=self.base_url,
+                             json_path=self.json_path, doc_root=self.doc_root, save_interval=0,
+                             cache_root=self.cache_root)
+
+    def tearDown(self):
+        self.daemon.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_interval(self):
+        popular = self.daemon.interval(100000, '2003-05-01')
+        self.assertLess(popular, self.daemon.interval(10, '2003-05-01'))
+        self.assertLess(self.daemon.interval(10, '2099-01-01'), self.daemon.interval(10, '2003-05-01'))
+        self.assertGreaterEqual(self.daemon.interval(10 ** 12, '2099-01-01'), self.daemon.min_interval)
+
+    def test_refresh(self):
+        start = time.time()
+        self.assertEqual(sorted(self.daemon.step() for _ in range(2)), [('album', 10), ('song', 20)])
+
+        with open(self.json_path) as f:
+            album = json.load(f)['albums'][0]
+        self.assertEqual((album['num_comments'], album['num_shared']), (3, 4))
+        self.assertEqual(album['songs'][0]['score'], 90)
+        self.assertEqual(album['songs'][0]['comm']['total'], 1000)
+        self.assertEqual(album['songs'][0]['comm']['con'][0]['content'], 'fresh')
+
+        song_readme = os.path.join(self.doc_root, 'albums', 'album_10', 'songs', 'song_20', 'README.md')
+        with open(song_readme) as f:
+            self.assertIn('fresh', f.read())
+        self.assertTrue(os.path.exists(os.path.join(self.doc_root, 'albums', 'album_10', 'README.md')))
+
+        self.assertEqual(len(os.listdir(self.cache_root)), 2)
+
+        # both items were rescheduled into the future
+        self.assertTrue(all(due > start for due, _, _, _ in self.daemon.queue))
+
+    def test_status(self):
+        self.daemon.step()
+        host, port = self.daemon.serve_status(port=0)
+        with urlopen('http://{:s}:{:d}/status'.format(host, port)) as r:
+            status = json.loads(r.read().decode('utf-8'))
+        self.assertEqual(status['requests'], 1)
+        self.assertEqual(status['queued'], 2)
+
+    def test_empty(self):
+        json_path = os.path.join(self.tmp.name, '2.json')
+        with open(json_path, 'w') as f:
+            json.dump(dict(_snapshot(), albums=[], album_ids=[]), f)
+        daemon = Daemon(2, json_path=json_path, doc_root=self.doc_root, cache_root=self.cache_root)
+        daemon.stop()
+        self.assertIsNone(daemon.step())
+        daemon.run()
@@ -0,0 +1,52 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+import export
+
+
+def _song(song_id, score, duration, time, liked):
+    return {
+        'id': song_id, 'name': 'song_{:d}'.format(song_id), 'score': score, 'duration': duration,
+        'time': time,
+        'comm': {'total': liked * 2, 'con': [{'commentId': song_id * 10, 'user': {'userId': 1},
+                                             'likedCount': liked, 'content': 'hi'}]}
+    }
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        songs = [_song(1, 100, 200000, '2003-05-01', 5), _song(2, 60, 180000, '2003-05-01', 50),
+                 _song(3, 80, 240000, '', 7)]
+        albums = [{'id': 10, 'name': 'a', 'num_song': 2, 'num_comments': 3, 'num_shared': 4,
+                   'time': '2003-05-01', 'songs': songs[:2]},
+                  {'id': 11, 'name': 'b', 'num_song': 1, 'num_comments': 0, 'num_shared': 0,
+                   'time': '', 'songs': songs[2:]}]
+        self.tables = export.flatten([{'id': 2116, 'albums': albums}])
+
+    def test_flatten(self):
+        self.assertEqual(self.tables['comments']['content'].dtype, object)
+        self.assertTrue(np.isnat(self.tables['songs']['release'][2]))
+
+    def test_reports(self):
+        self.assertEqual(list(export.top_songs(self.tables, 2)['song_id']), [1, 3])
+        self.assertEqual(list(export.top_comments(self.tables, 1)['liked_count']), [50])
+
+        dist = export.score_by_year(self.tables)
+        self.assertEqual(list(dist['year']), [0, 2003])
+        self.assertEqual(list(dist['median']), [80, 80])
+        self.assertEqual(list(dist['max']), [80, 100])
+
+        counts, _ = export.duration_histogram(self.tables, bins=2)
+        self.assertEqual(counts.sum(), 3)
+
+    def test_save_load(self):
+        for fmt in ('npz', 'parquet'):
+            if fmt == 'parquet' and export.pq is None:
+                continue
+            with tempfile.TemporaryDirectory() as folder:
+                export.save(self.tables, folder, fmt)
+                tables = export.load(folder)
+            self.assertTrue(np.array_equal(tables['songs']['score'], self.tables['songs']['score']))
+            self.assertEqual(list(tables['albums']['name']), ['a', 'b'])
@@ -0,0 +1,149 @@
+import os
+import tempfile
+from base64 import encodebytes
+from collections import namedtuple
+from unittest import TestCase, mock
+
+from worker import Store, TaskQueue, Worker, assemble
+
+SongInfo = namedtuple('SongInfo', ['id', 'duration', 'score'])
+
+
+class TestTaskQueue(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = TaskQueue(os.path.join(self.tmp.name, 'queue.sqlite'), max_attempts=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lease(self):
+        self.queue.put('album', 1)
+        self.queue.put('album', 1)
+        task = self.queue.lease('a')
+        self.assertEqual(task.item_id, 1)
+        self.assertIsNone(self.queue.lease('b'))
+        self.assertTrue(self.queue.heartbeat(task, 'a'))
+        self.assertFalse(self.queue.heartbeat(task, 'b'))
+        self.assertTrue(self.queue.done(task, 'a'))
+        self.assertTrue(self.queue.finished())
+
+    def test_reclaim(self):
+        self.queue.put('song', 2, {'score': 100})
+        task = self.queue.lease('a', lease_time=-1)
+        self.assertEqual(self.queue.counts()['pending'], 1)
+
+        task_b = self.queue.lease('b')
+        self.assertEqual(task_b.id, task.id)
+        self.assertEqual(task_b.payload, {'score': 100})
+        self.assertFalse(self.queue.done(task, 'a'))
+        self.assertTrue(self.queue.done(task_b, 'b'))
+
+    def test_fail(self):
+        self.queue.put('song', 3)
+        self.queue.fail(self.queue.lease('a'), 'a')
+        self.queue.fail(self.queue.lease('a'), 'a')
+        self.assertIsNone(self.queue.lease('a'))
+        self.assertEqual(self.queue.counts()['failed'], 1)
+        self.assertTrue(self.queue.finished())
+
+    def test_expired_last_attempt(self):
+        self.queue.put('song', 4)
+        self.queue.fail(self.queue.lease('a'), 'a')
+        task = self.queue.lease('a', lease_time=-1)
+        self.assertEqual(self.queue.counts()['failed'], 1)
+        self.assertFalse(self.queue.done(task, 'a'))
+        self.assertFalse(self.queue.heartbeat(task, 'a'))
+
+
+class FakeAlbum(object):
+    def __init__(self, album_id, eager=True):
+        self.id = album_id
+        self.name = 'album'
+        self.time = '2003-05-01'
+        self._songs_info = [SongInfo(20, 180000, 90), SongInfo(21, 200000, 60)]
+
+    def get_info(self, songs=True):
+        pass
+
+    def to_json(self):
+        return {
+            'id': self.id, 'url': '', 'img': encodebytes(b'img').decode('ascii'), 'img_link': '',
+            'name': self.name, 'singers': ['s'], 'company': '', 'time': self.time, 'description': [],
+            'num_comments': 3, 'num_shared': 4, 'num_song': 2,
+            'songs_info': [s._asdict() for s in self._songs_info], 'songs': self.songs
+        }
+
+
+class FakeSong(object):
+    fail = set()
+
+    def __init__(self, s, duration=0, score=0, time=None):
+        if s in self.fail:
+            raise ValueError('no such song')
+        self.id = s
+        self.name = 'song_{:d}'.format(s)
+        self.duration, self.score, self.time = duration, score, time
+
+    def to_json(self):
+        reply = {'beRepliedCommentId': 1, 'content': 'first', 'user': {'userId': 2, 'nickname': 'b'}}
+        return {
+            'id': self.id, 'url': '', 'name': self.name, 'time': self.time, 'score': self.score,
+            'album': 'album', 'singers': ['s'], 'duration': self.duration,
+            'ric': {'id': self.id, 'url': '', 'modified': False, 'singer': '', 'composer': '',
+                    'songwriter': '', 'arrangement': '', 'lyric': ['la']},
+            'comm': {'id': self.id, 'url': '', 'total': 10, 'num_coms': 1,
+                     'con': [{'commentId': 5, 'user': {'userId': 3, 'nickname': 'a'}, 'content': 'hi',
+                              'likedCount': 7, 'beReplied': [reply]}]}
+        }
+
+
+class TestWorker(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patches = [mock.patch('worker.Album', FakeAlbum), mock.patch('worker.Song', FakeSong)]
+        for p in self.patches:
+            p.start()
+
+        self.store = Store(1, self.tmp.name)
+        self.store.write('singer', {'id': 1, 'url': '', 'name': 's', 'alias': 's', 'album_ids': [10]})
+        self.worker = Worker(1, worker_id='a', root=self.tmp.name)
+        self.worker.queue.put('album', 10)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        FakeSong.fail = set()
+        self.tmp.cleanup()
+
+    def test_assemble(self):
+        with self.assertRaises(RuntimeError):
+            assemble(1, self.tmp.name, build_doc=False)
+
+        self.worker.run(idle=0)
+        self.assertEqual(self.worker.queue.counts()['done'], 3)
+        self.assertEqual(self.store.read('song', 21)['score'], 60)
+
+        singer = assemble(1, self.tmp.name, build_doc=False)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, '1.json')))
+        songs = singer.albums[0].songs
+        self.assertEqual([so.id for so in songs], [20, 21])
+        self.assertEqual(songs[0].time, '2003-05-01')
+        self.assertEqual(songs[0].comment.total, 10)
+        self.assertEqual(songs[0].comment.cons[0].user.name, 'a')
+        self.assertEqual(songs[0].comment.cons[0].replied.content, 'first')
+        self.assertEqual(singer.to_json()['albums'][0]['songs'], [self.store.read('song', 20),
+                                                                  self.store.read('song', 21)])
+
+    def test_failed(self):
+        FakeSong.fail = {21}
+        self.worker.run(idle=0)
+        self.assertEqual(self.worker.queue.counts()['failed'], 1)
+        with self.assertRaises(RuntimeError):
+            assemble(1, self.tmp.name, build_doc=False)
+
+    def test_lost_lease(self):
+        task = self.worker.queue.lease('a', lease_time=-1)
+        self.assertEqual(self.worker.queue.lease('b').id, task.id)
+        self.assertFalse(self.worker.run_task(task))
+        self.assertEqual(self.worker.queue.counts()['leased'], 1)
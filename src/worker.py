@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from spider import CURR_FOLDER, Album, Singer, Song
+
+Task = namedtuple('Task', ['id', 'kind', 'item_id', 'payload', 'attempts'])
+
+
+class TaskQueue(object):
+    """SQLite backed work queue shared by several worker processes.
+
+    A task is handed out with a lease, the owner keeps it alive with
+    `heartbeat`. Tasks whose lease ran out (e.g. the worker crashed) are
+    handed out again by the next `lease` call.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS tasks ('
+                         'id TEXT PRIMARY KEY, '
+                         'kind TEXT NOT NULL, '
+                         'item_id INTEGER NOT NULL, '
+                         'payload TEXT NOT NULL, '
+                         "state TEXT NOT NULL DEFAULT 'pending', "
+                         'owner TEXT, '
+                         'lease_until REAL NOT NULL DEFAULT 0, '
+                         'attempts INTEGER NOT NULL DEFAULT 0)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.execute('PRAGMA busy_timeout = 60000')
+        return _Transaction(conn)
+
+    def put(self, kind, item_id, payload=None):
+        task_id = '{:s}:{:d}'.format(kind, item_id)
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO tasks (id, kind, item_id, payload) VALUES (?, ?, ?, ?)',
+                         (task_id, kind, item_id, json.dumps(payload or {})))
+        return task_id
+
+    def _expire(self, conn, now):
+        # leases that ran out on their last attempt will never be handed out again
+        conn.execute("UPDATE tasks SET state = 'failed', owner = NULL, lease_until = 0 "
+                     "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                     (now, self.max_attempts))
+
+    def lease(self, owner, lease_time=60):
+        now = time.time()
+        with self._connect() as conn:
+            self._expire(conn, now)
+            row = conn.execute("SELECT id, kind, item_id, payload, attempts FROM tasks "
+                               "WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)) "
+                               "AND attempts < ? ORDER BY kind, rowid LIMIT 1",
+                               (now, self.max_attempts)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, "
+                         "attempts = attempts + 1 WHERE id = ?",
+                         (owner, now + lease_time, row[0]))
+        return Task(row[0], row[1], row[2], json.loads(row[3]), row[4] + 1)
+
+    def heartbeat(self, task, owner, lease_time=60):
+        """Extend the lease of `task`, returns False if it was lost to another worker."""
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE tasks SET lease_until = ? "
+                               "WHERE id = ? AND owner = ? AND state = 'leased'",
+                               (time.time() + lease_time, task.id, owner))
+        return cur.rowcount == 1
+
+    def done(self, task, owner):
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE tasks SET state = 'done' "
+                               "WHERE id = ? AND owner = ? AND state = 'leased'",
+                               (task.id, owner))
+        return cur.rowcount == 1
+
+    def fail(self, task, owner):
+        with self._connect() as conn:
+            conn.execute("UPDATE tasks SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                         "owner = NULL, lease_until = 0 WHERE id = ? AND owner = ?",
+                         (self.max_attempts, task.id, owner))
+
+    def counts(self):
+        """Number of tasks per state, expired leases are counted as pending."""
+        now = time.time()
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        with self._connect() as conn:
+            self._expire(conn, now)
+            rows = conn.execute('SELECT state, lease_until FROM tasks').fetchall()
+        for state, lease_until in rows:
+            if state == 'leased' and lease_until < now:
+                state = 'pending'
+            counts[state] += 1
+        return counts
+
+    def finished(self):
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+
+class _Transaction(object):
+    """Wrap a connection so that `with` runs one write transaction and closes it."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.conn.close()
+
+
+class Store(object):
+    """Per singer snapshot parts shared by the workers, one json file per album or song."""
+
+    def __init__(self, singer_id, root=None):
+        self.singer_id = singer_id
+        self.root = os.path.join(root or os.path.join(CURR_FOLDER, 'json_src'), str(singer_id))
+
+    @property
+    def queue_path(self):
+        return os.path.join(self.root, 'queue.sqlite')
+
+    def _path(self, kind, item_id=None):
+        if item_id is None:
+            return os.path.join(self.root, kind + '.json')
+        return os.path.join(self.root, kind + 's', '{:d}.json'.format(item_id))
+
+    def write(self, kind, json_con, item_id=None):
+        path = self._path(kind, item_id)
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        tmp_path = '{:s}.{:d}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump(json_con, fp, indent=4, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def read(self, kind, item_id=None):
+        with open(self._path(kind, item_id)) as fp:
+            return json.load(fp)
+
+    def exists(self, kind, item_id=None):
+        return os.path.exists(self._path(kind, item_id))
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, queue, task, owner, lease_time):
+        super(_Heartbeat, self).__init__(daemon=True)
+        self.queue = queue
+        self.task = task
+        self.owner = owner
+        self.lease_time = lease_time
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.lease_time / 3):
+            if not self.queue.heartbeat(self.task, self.owner, self.lease_time):
+                self.lost = True
+                break
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Worker(object):
+    def __init__(self, singer_id, worker_id=None, lease_time=60, root=None):
+        self.store = Store(singer_id, root)
+        self.queue = TaskQueue(self.store.queue_path)
+        self.worker_id = worker_id or '{:s}-{:d}'.format(socket.gethostname(), os.getpid())
+        self.lease_time = lease_time
+
+    def run(self, idle=5):
+        """Process tasks until the queue is drained."""
+        while True:
+            task = self.queue.lease(self.worker_id, self.lease_time)
+            if task is None:
+                if self.queue.finished():
+                    break
+                # other workers still hold leases, some of them may expire
+                time.sleep(idle)
+                continue
+            self.run_task(task)
+
+    def run_task(self, task):
+        """Process one leased task, returns False if it failed or its lease was lost."""
+        heartbeat = _Heartbeat(self.queue, task, self.worker_id, self.lease_time)
+        heartbeat.start()
+        try:
+            if task.kind == 'album':
+                self._run_album(task)
+            elif task.kind == 'song':
+                self._run_song(task)
+            else:
+                raise ValueError('unknown task kind: {:s}'.format(task.kind))
+        except Exception as e:
+            heartbeat.stop()
+            print('WARNING: {:s} failed at {:s} ({:d}): {!r}'.format(
+                self.worker_id, task.id, task.attempts, e))
+            self.queue.fail(task, self.worker_id)
+            return False
+
+        heartbeat.stop()
+        if heartbeat.lost or not self.queue.done(task, self.worker_id):
+            print('WARNING: {:s} lost the lease of {:s}'.format(self.worker_id, task.id))
+            return False
+        return True
+
+    def _run_album(self, task):
+        album = Album(task.item_id, eager=False)
+        album.get_info(songs=False)
+        album.songs = []
+
+        json_con = album.to_json()
+        del json_con['songs']
+        self.store.write('album', json_con, album.id)
+
+        for s in album._songs_info:
+            self.queue.put('song', s.id, {'album': album.id, 'duration': s.duration,
+                                          'score': s.score, 'time': album.time})
+        print('Analyzed album: {:s} ({:d} songs).'.format(album.name, len(album._songs_info)))
+
+    def _run_song(self, task):
+        payload = task.payload
+        song = Song(task.item_id, payload['duration'], payload['score'], payload['time'])
+        self.store.write('song', song.to_json(), song.id)
+        print('\tFetched song: {:s}.'.format(song.name))
+
+
+def seed(singer_id, root=None):
+    """Fetch the singer page and enqueue one task per album."""
+    store = Store(singer_id, root)
+    queue = TaskQueue(store.queue_path)
+
+    singer = Singer(singer_id, eager=False)
+    singer.get_info()
+    singer.get_all_albums_id()
+    store.write('singer', {
+        'id': singer.id,
+        'url': singer.url,
+        'name': singer.name,
+        'alias': singer.alias,
+        'album_ids': singer._album_ids
+    })
+
+    for album_id in singer._album_ids:
+        queue.put('album', album_id)
+    return queue
+
+
+def assemble(singer_id, root=None, build_doc=True):
+    """Merge the worker results into `json_src/<singer_id>.json` once all tasks finished."""
+    store = Store(singer_id, root)
+    queue = TaskQueue(store.queue_path)
+
+    counts = queue.counts()
+    if not queue.finished():
+        raise RuntimeError('{:d} tasks pending, {:d} leased'.format(counts['pending'], counts['leased']))
+    if counts['failed']:
+        raise RuntimeError('{:d} tasks failed'.format(counts['failed']))
+
+    json_con = store.read('singer')
+    albums = []
+    for album_id in json_con['album_ids']:
+        album = store.read('album', album_id)
+        album['songs'] = [store.read('song', s['id']) for s in album['songs_info']]
+        albums.append(album)
+    json_con['albums'] = albums
+
+    json_path = os.path.join(os.path.dirname(store.root), '{:d}.json'.format(singer_id))
+    with open(json_path, 'w') as fp:
+        json.dump(json_con, fp, indent=4, sort_keys=True)
+
+    singer = Singer.from_json(json_con)
+    if build_doc:
+        singer.build_doc()
+    return singer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distributed crawl of a singer.')
+    parser.add_argument('command', choices=['seed', 'work', 'assemble'])
+    parser.add_argument('singer_id', type=int, nargs='?', default=2116)
+    parser.add_argument('--root', default=None, help='shared json_src folder')
+    parser.add_argument('--lease', type=int, default=60, help='lease time in seconds')
+    parser.add_argument('--no-doc', action='store_true', help='skip building docs on assemble')
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        print(seed(args.singer_id, args.root).counts())
+    elif args.command == 'work':
+        Worker(args.singer_id, lease_time=args.lease, root=args.root).run()
+    else:
+        assemble(args.singer_id, args.root, build_doc=not args.no_doc)